@@ -1,14 +1,29 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List, Dict
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, TypeAdapter
+from typing import Optional, List, Dict, Tuple
 import os
 import uuid
-from pymongo import MongoClient
+import json
+import hashlib
+import orjson
+import asyncio
+import time
+import secrets
+from datetime import datetime, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from cachetools import TTLCache
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import PyMongoError
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
 import uvicorn
+import stripe
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -23,11 +38,24 @@ app.add_middleware(
 MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 DB_NAME = os.environ.get('DB_NAME', 'artist_portfolio')
 
-client = MongoClient(MONGO_URL)
+MONGO_POOL_MAX = int(os.environ.get('MONGO_POOL_MAX', '50'))
+MONGO_POOL_MIN = int(os.environ.get('MONGO_POOL_MIN', '5'))
+
+# Pool size is per worker: keep MONGO_POOL_MAX * workers below the server's connection limit
+client = AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=MONGO_POOL_MAX,
+    minPoolSize=MONGO_POOL_MIN,
+    serverSelectionTimeoutMS=3000,
+    connectTimeoutMS=3000,
+    socketTimeoutMS=5000,
+    retryWrites=True,
+)
 db = client[DB_NAME]
 
 # Stripe initialization
 STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY')
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
 stripe_checkout = None
 
 if STRIPE_API_KEY:
@@ -36,11 +64,79 @@ if STRIPE_API_KEY:
 else:
     print("Warning: STRIPE_API_KEY not found - payment features disabled")
 
+if not STRIPE_WEBHOOK_SECRET:
+    print("Warning: STRIPE_WEBHOOK_SECRET not found - orders are verified against Stripe on completion")
+
+# Stripe redirect targets
+CHECKOUT_SUCCESS_URL = 'https://b53e54d0-03b2-4a93-9b74-3e843efe8655.preview.emergentagent.com/success?session_id={CHECKOUT_SESSION_ID}'
+CHECKOUT_CANCEL_URL = 'https://b53e54d0-03b2-4a93-9b74-3e843efe8655.preview.emergentagent.com'
+
+# Pending-order reconciliation is an admin task, disabled unless a token is configured
+RECONCILE_TOKEN = os.environ.get('RECONCILE_TOKEN')
+RECONCILE_BATCH_SIZE = int(os.environ.get('RECONCILE_BATCH_SIZE', '100'))
+RECONCILE_MAX_FAILURES = int(os.environ.get('RECONCILE_MAX_FAILURES', '5'))
+
+# Cap on concurrent outbound Stripe calls per worker
+STRIPE_MAX_INFLIGHT = int(os.environ.get('STRIPE_MAX_INFLIGHT', '8'))
+stripe_semaphore = asyncio.Semaphore(STRIPE_MAX_INFLIGHT)
+
+@retry(
+    wait=wait_random_exponential(multiplier=0.2, max=8),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception_type(stripe.error.RateLimitError),
+    reraise=True,
+)
+async def call_stripe(func, *args):
+    """Run a blocking Stripe call off the event loop, retrying on rate limits"""
+    async with stripe_semaphore:
+        return await asyncio.to_thread(func, *args)
+
+# Per-client cap on in-flight checkout requests, shared across workers through Redis when configured
+REDIS_URL = os.environ.get('REDIS_URL')
+CHECKOUT_MAX_CONCURRENT = int(os.environ.get('CHECKOUT_MAX_CONCURRENT', '5'))
+CHECKOUT_SLOT_TTL_MS = 60000  # slots left behind by crashed requests expire after this
+redis_client = None
+acquire_checkout_slot_script = None
+local_checkout_inflight: Dict[str, int] = {}
+
+# KEYS[1]: in-flight set; ARGV: now_ms, slot_ttl_ms, limit, request_id
+ACQUIRE_CHECKOUT_SLOT_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[1]) - tonumber(ARGV[2]))
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+if REDIS_URL:
+    redis_client = aioredis.from_url(REDIS_URL)
+    acquire_checkout_slot_script = redis_client.register_script(ACQUIRE_CHECKOUT_SLOT_LUA)
+    print("Redis checkout limiter enabled")
+else:
+    print("Warning: REDIS_URL not found - checkout concurrency is limited per worker")
+
 # Collections
 artworks_collection = db.artworks
 orders_collection = db.orders
 payment_transactions_collection = db.payment_transactions
 
+# Version tag for the artwork catalogue. There are no write endpoints, so it is recomputed
+# periodically to pick up edits made directly in Mongo
+artworks_etag = None
+artworks_etag_checked_at = 0.0
+ARTWORKS_ETAG_TTL_SECONDS = 60
+ARTWORKS_CACHE_CONTROL = "public, max-age=60"
+
+# Short-lived in-process cache of artwork documents keyed by id
+artwork_cache = TTLCache(maxsize=2048, ttl=60)
+
+# Encoded featured-artworks response body, rebuilt when the catalogue changes or it expires
+featured_cache: Optional[Tuple[bytes, float]] = None  # (body, built_at)
+FEATURED_CACHE_TTL_SECONDS = 300
+FEATURED_CACHE_CONTROL = f"public, max-age={FEATURED_CACHE_TTL_SECONDS}"
+
 # Pydantic models
 class Artwork(BaseModel):
     id: str
@@ -67,114 +163,251 @@ class Order(BaseModel):
     items: List[CartItem]
     total_amount: float
     customer_email: str
-    status: str  # "pending", "paid", "shipped", "completed"
+    status: str  # "pending", "paid", "expired", "shipped", "completed"
     payment_session_id: Optional[str] = None
 
+# Dumps a list of cart items in one pydantic-core call
+cart_items_adapter = TypeAdapter(List[CartItem])
+
 # Sample artwork data
-sample_artworks = [
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Azure Dreams",
-        "price": 850.00,
-        "medium": "Acrylic on Canvas",
-        "size": "24\" x 36\"",
-        "year_created": 2024,
-        "description": "A mesmerizing abstract composition featuring flowing blue and white elements that evoke the tranquility of ocean waves and sky.",
-        "image_url": "https://images.unsplash.com/photo-1595878715977-2e8f8df18ea8",
-        "category": "abstract",
-        "availability": "available"
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Dynamic Blue",
-        "price": 720.00,
-        "medium": "Oil on Canvas",
-        "size": "20\" x 24\"",
-        "year_created": 2024,
-        "description": "Bold abstract expressionism with powerful blue and white strokes creating movement and energy.",
-        "image_url": "https://images.unsplash.com/photo-1550843739-2e9e3eddeccb",
-        "category": "abstract",
-        "availability": "available"
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Textured Serenity",
-        "price": 950.00,
-        "medium": "Mixed Media",
-        "size": "30\" x 40\"",
-        "year_created": 2023,
-        "description": "Rich textural elements combined with soothing blue tones create depth and contemplative beauty.",
-        "image_url": "https://images.unsplash.com/photo-1558447281-b59a4a4ca7b0",
-        "category": "abstract",
-        "availability": "available"
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Peaceful Valley",
-        "price": 1200.00,
-        "medium": "Oil on Canvas",
-        "size": "36\" x 48\"",
-        "year_created": 2024,
-        "description": "A serene landscape capturing the quiet beauty of rolling hills under an expansive blue sky.",
-        "image_url": "https://images.unsplash.com/photo-1661089359976-de812515d817",
-        "category": "landscape",
-        "availability": "available"
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Mountain Majesty",
-        "price": 1450.00,
-        "medium": "Acrylic on Canvas",
-        "size": "40\" x 60\"",
-        "year_created": 2023,
-        "description": "Majestic mountain peaks painted with atmospheric perspective and beautiful blue atmospheric effects.",
-        "image_url": "https://images.unsplash.com/photo-1648728066884-74aaf02585a5",
-        "category": "landscape",
-        "availability": "available"
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Sky Dreams",
-        "price": 675.00,
-        "medium": "Digital Art Print",
-        "size": "18\" x 24\"",
-        "year_created": 2024,
-        "description": "An artistic interpretation of sky and clouds with creative blue elements and modern composition.",
-        "image_url": "https://images.unsplash.com/photo-1594201272716-9ad78d16848b",
-        "category": "digital",
-        "availability": "available"
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Fluid Harmony",
-        "price": 780.00,
-        "medium": "Pour Painting",
-        "size": "24\" x 30\"",
-        "year_created": 2024,
-        "description": "A beautiful fluid art piece with marbled blue, green, and pink tones creating organic harmony.",
-        "image_url": "https://images.unsplash.com/photo-1614519679717-a75c4201c2df",
-        "category": "abstract",
-        "availability": "available"
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Digital Visions",
-        "price": 525.00,
-        "medium": "Digital Art Print",
-        "size": "16\" x 20\"",
-        "year_created": 2024,
-        "description": "Contemporary digital artwork featuring blue tones and artistic composition with modern appeal.",
-        "image_url": "https://images.unsplash.com/photo-1551596210-4da509bd1e99",
-        "category": "digital",
-        "availability": "available"
-    }
-]
+SAMPLE_ARTWORK_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "artist-portfolio/artworks")
+
+def sample_artwork_id(title: str) -> str:
+    return str(uuid.uuid5(SAMPLE_ARTWORK_NAMESPACE, title))
+
+def sample_artworks() -> List[dict]:
+    """Seed documents, built only when the collection needs seeding"""
+    return [
+        {
+            "id": sample_artwork_id("Azure Dreams"),
+            "title": "Azure Dreams",
+            "price": 850.00,
+            "medium": "Acrylic on Canvas",
+            "size": "24\" x 36\"",
+            "year_created": 2024,
+            "description": "A mesmerizing abstract composition featuring flowing blue and white elements that evoke the tranquility of ocean waves and sky.",
+            "image_url": "https://images.unsplash.com/photo-1595878715977-2e8f8df18ea8",
+            "category": "abstract",
+            "availability": "available"
+        },
+        {
+            "id": sample_artwork_id("Dynamic Blue"),
+            "title": "Dynamic Blue",
+            "price": 720.00,
+            "medium": "Oil on Canvas",
+            "size": "20\" x 24\"",
+            "year_created": 2024,
+            "description": "Bold abstract expressionism with powerful blue and white strokes creating movement and energy.",
+            "image_url": "https://images.unsplash.com/photo-1550843739-2e9e3eddeccb",
+            "category": "abstract",
+            "availability": "available"
+        },
+        {
+            "id": sample_artwork_id("Textured Serenity"),
+            "title": "Textured Serenity",
+            "price": 950.00,
+            "medium": "Mixed Media",
+            "size": "30\" x 40\"",
+            "year_created": 2023,
+            "description": "Rich textural elements combined with soothing blue tones create depth and contemplative beauty.",
+            "image_url": "https://images.unsplash.com/photo-1558447281-b59a4a4ca7b0",
+            "category": "abstract",
+            "availability": "available"
+        },
+        {
+            "id": sample_artwork_id("Peaceful Valley"),
+            "title": "Peaceful Valley",
+            "price": 1200.00,
+            "medium": "Oil on Canvas",
+            "size": "36\" x 48\"",
+            "year_created": 2024,
+            "description": "A serene landscape capturing the quiet beauty of rolling hills under an expansive blue sky.",
+            "image_url": "https://images.unsplash.com/photo-1661089359976-de812515d817",
+            "category": "landscape",
+            "availability": "available"
+        },
+        {
+            "id": sample_artwork_id("Mountain Majesty"),
+            "title": "Mountain Majesty",
+            "price": 1450.00,
+            "medium": "Acrylic on Canvas",
+            "size": "40\" x 60\"",
+            "year_created": 2023,
+            "description": "Majestic mountain peaks painted with atmospheric perspective and beautiful blue atmospheric effects.",
+            "image_url": "https://images.unsplash.com/photo-1648728066884-74aaf02585a5",
+            "category": "landscape",
+            "availability": "available"
+        },
+        {
+            "id": sample_artwork_id("Sky Dreams"),
+            "title": "Sky Dreams",
+            "price": 675.00,
+            "medium": "Digital Art Print",
+            "size": "18\" x 24\"",
+            "year_created": 2024,
+            "description": "An artistic interpretation of sky and clouds with creative blue elements and modern composition.",
+            "image_url": "https://images.unsplash.com/photo-1594201272716-9ad78d16848b",
+            "category": "digital",
+            "availability": "available"
+        },
+        {
+            "id": sample_artwork_id("Fluid Harmony"),
+            "title": "Fluid Harmony",
+            "price": 780.00,
+            "medium": "Pour Painting",
+            "size": "24\" x 30\"",
+            "year_created": 2024,
+            "description": "A beautiful fluid art piece with marbled blue, green, and pink tones creating organic harmony.",
+            "image_url": "https://images.unsplash.com/photo-1614519679717-a75c4201c2df",
+            "category": "abstract",
+            "availability": "available"
+        },
+        {
+            "id": sample_artwork_id("Digital Visions"),
+            "title": "Digital Visions",
+            "price": 525.00,
+            "medium": "Digital Art Print",
+            "size": "16\" x 20\"",
+            "year_created": 2024,
+            "description": "Contemporary digital artwork featuring blue tones and artistic composition with modern appeal.",
+            "image_url": "https://images.unsplash.com/photo-1551596210-4da509bd1e99",
+            "category": "digital",
+            "availability": "available"
+        }
+    ]
 
 @app.on_event("startup")
 async def startup_event():
+    # Connect eagerly so the pool is warm before the first request
+    await client.admin.command("ping")
+    
+    # Indexes backing the id lookups and the listing filters
+    try:
+        await artworks_collection.create_index("id", unique=True, background=True)
+        await artworks_collection.create_index([("availability", 1), ("category", 1)], background=True)
+        await orders_collection.create_index("id", unique=True, background=True)
+        await orders_collection.create_index("payment_session_id", background=True)
+        await orders_collection.create_index([("status", 1), ("reconciled_at", 1)], background=True)
+    except PyMongoError as e:
+        print(f"Warning: failed to create indexes - {str(e)}")
+    
     # Initialize sample data if collection is empty
-    if artworks_collection.count_documents({}) == 0:
-        artworks_collection.insert_many(sample_artworks)
+    # Ids are deterministic, so concurrent seeding by several workers upserts the same rows
+    if await artworks_collection.count_documents({}) == 0:
+        await artworks_collection.bulk_write([
+            UpdateOne({"id": artwork["id"]}, {"$setOnInsert": artwork}, upsert=True)
+            for artwork in sample_artworks()
+        ])
+    
+    await refresh_artworks_etag()
+
+async def refresh_artworks_etag():
+    """Recompute the catalogue ETag, dropping cached artworks if the catalogue changed"""
+    global artworks_etag, artworks_etag_checked_at, featured_cache
+    # Stamp first so concurrent requests don't all recompute at once
+    artworks_etag_checked_at = time.monotonic()
+    artworks = await artworks_collection.find({}, {"_id": 0}).sort("id", 1).to_list(length=None)
+    digest = hashlib.blake2b(json.dumps(artworks, sort_keys=True).encode(), digest_size=16).hexdigest()
+    etag = f'W/"{digest}"'
+    if etag != artworks_etag:
+        artwork_cache.clear()
+        featured_cache = None
+        artworks_etag = etag
+
+async def current_artworks_etag() -> Optional[str]:
+    if artworks_etag is None or time.monotonic() - artworks_etag_checked_at > ARTWORKS_ETAG_TTL_SECONDS:
+        await refresh_artworks_etag()
+    return artworks_etag
+
+async def get_artworks_by_id(artwork_ids: List[str]) -> Dict[str, dict]:
+    """Look up artworks by id, querying Mongo only for ids missing from the cache"""
+    artworks_by_id = {}
+    missing_ids = []
+    for artwork_id in artwork_ids:
+        artwork = artwork_cache.get(artwork_id)
+        if artwork is None:
+            missing_ids.append(artwork_id)
+        else:
+            artworks_by_id[artwork_id] = artwork
+    
+    if missing_ids:
+        artworks = await artworks_collection.find({"id": {"$in": missing_ids}}, {"_id": 0}).to_list(length=None)
+        for artwork in artworks:
+            artwork_cache[artwork["id"]] = artwork
+            artworks_by_id[artwork["id"]] = artwork
+    return artworks_by_id
+
+async def get_artwork_cached(artwork_id: str) -> Optional[dict]:
+    artworks_by_id = await get_artworks_by_id([artwork_id])
+    return artworks_by_id.get(artwork_id)
+
+async def insert_orders(orders: List[dict]):
+    """Write orders in a single unordered batch"""
+    await orders_collection.bulk_write([InsertOne(order) for order in orders], ordered=False)
+
+async def limit_checkout_concurrency(request: Request):
+    """Reject a client's request with 429 while it already has too many checkouts in flight
+
+    Relies on nginx forwarding X-Forwarded-For and uvicorn running with --proxy-headers
+    (see entrypoint.sh); otherwise every client appears as the proxy's address.
+    """
+    client_ip = request.client.host if request.client else "unknown"
+    key = f"checkout_inflight:{client_ip}"
+    request_id = str(uuid.uuid4())
+    
+    use_redis = redis_client is not None
+    if use_redis:
+        try:
+            acquired = await acquire_checkout_slot_script(
+                keys=[key],
+                args=[int(time.time() * 1000), CHECKOUT_SLOT_TTL_MS, CHECKOUT_MAX_CONCURRENT, request_id]
+            )
+        except RedisError as e:
+            # Fail open rather than blocking checkout on a Redis outage
+            print(f"Warning: checkout limiter unavailable - {str(e)}")
+            use_redis = False
+            acquired = True
+            key = None
+    else:
+        acquired = local_checkout_inflight.get(key, 0) < CHECKOUT_MAX_CONCURRENT
+        if acquired:
+            local_checkout_inflight[key] = local_checkout_inflight.get(key, 0) + 1
+    
+    if not acquired:
+        raise HTTPException(status_code=429, detail="Too many concurrent checkout requests")
+    
+    try:
+        yield
+    finally:
+        if use_redis:
+            try:
+                await redis_client.zrem(key, request_id)
+            except RedisError:
+                pass  # the slot expires on its own
+        elif key is not None:
+            remaining = local_checkout_inflight.get(key, 1) - 1
+            if remaining > 0:
+                local_checkout_inflight[key] = remaining
+            else:
+                local_checkout_inflight.pop(key, None)
+
+async def is_not_modified(request: Request) -> bool:
+    # Always brings the ETag up to date, so set_cache_headers sends the current one
+    etag = await current_artworks_etag()
+    if_none_match = request.headers.get("if-none-match")
+    if not etag or not if_none_match:
+        return False
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+def set_cache_headers(response: Response, cache_control: str = ARTWORKS_CACHE_CONTROL):
+    if artworks_etag:
+        response.headers["ETag"] = artworks_etag
+    response.headers["Cache-Control"] = cache_control
+
+def not_modified_response(cache_control: str = ARTWORKS_CACHE_CONTROL) -> Response:
+    response = Response(status_code=304)
+    set_cache_headers(response, cache_control)
+    return response
 
 @app.get("/")
 async def root():
@@ -182,52 +415,74 @@ async def root():
 
 # Artwork endpoints
 @app.get("/api/artworks")
-async def get_artworks(category: Optional[str] = None, availability: Optional[str] = None):
+async def get_artworks(request: Request, response: Response, category: Optional[str] = None, availability: Optional[str] = None):
+    if await is_not_modified(request):
+        return not_modified_response()
+    
     query = {}
     if category:
         query["category"] = category
     if availability:
         query["availability"] = availability
     
-    artworks = list(artworks_collection.find(query, {"_id": 0}))
+    artworks = await artworks_collection.find(query, {"_id": 0}).to_list(length=None)
+    set_cache_headers(response)
     return artworks
 
 @app.get("/api/artworks/{artwork_id}")
-async def get_artwork(artwork_id: str):
-    artwork = artworks_collection.find_one({"id": artwork_id}, {"_id": 0})
+async def get_artwork(artwork_id: str, request: Request, response: Response):
+    artwork = await get_artwork_cached(artwork_id)
     if not artwork:
         raise HTTPException(status_code=404, detail="Artwork not found")
+    
+    if await is_not_modified(request):
+        return not_modified_response()
+    set_cache_headers(response)
     return artwork
 
 # Featured artworks for homepage
 @app.get("/api/featured-artworks")
-async def get_featured_artworks():
-    # Return first 3 available artworks as featured
-    artworks = list(artworks_collection.find({"availability": "available"}, {"_id": 0}).limit(3))
-    return artworks
+async def get_featured_artworks(request: Request):
+    global featured_cache
+    if await is_not_modified(request):
+        return not_modified_response(FEATURED_CACHE_CONTROL)
+    
+    if featured_cache is None or time.monotonic() - featured_cache[1] > FEATURED_CACHE_TTL_SECONDS:
+        # Return first 3 available artworks as featured
+        artworks = await artworks_collection.find({"availability": "available"}, {"_id": 0}).limit(3).to_list(length=None)
+        featured_cache = (orjson.dumps(artworks), time.monotonic())
+    
+    response = Response(content=featured_cache[0], media_type="application/json")
+    set_cache_headers(response, FEATURED_CACHE_CONTROL)
+    return response
 
 # Cart and order endpoints (basic structure for now)
 @app.post("/api/cart/add")
 async def add_to_cart(item: CartItem):
     # For now, just validate artwork exists
-    artwork = artworks_collection.find_one({"id": item.artwork_id}, {"_id": 0})
-    if not artwork:
+    exists = item.artwork_id in artwork_cache or await artworks_collection.find_one(
+        {"id": item.artwork_id}, {"_id": 0, "id": 1}
+    ) is not None
+    if not exists:
         raise HTTPException(status_code=404, detail="Artwork not found")
     return {"message": "Item added to cart", "item": item}
 
 # Stripe checkout endpoints
-@app.post("/api/checkout/create-session")
+@app.post("/api/checkout/create-session", dependencies=[Depends(limit_checkout_concurrency)])
 async def create_checkout_session(checkout_request: CheckoutRequest):
     if not stripe_checkout:
         raise HTTPException(status_code=503, detail="Payment service not available")
     
     try:
+        # Fetch every artwork in the cart with at most one query
+        artworks_by_id = await get_artworks_by_id([item.artwork_id for item in checkout_request.items])
+        
         # Calculate line items from cart
         line_items = []
         total_amount = 0
         
         for item in checkout_request.items:
-            artwork = artworks_collection.find_one({"id": item.artwork_id}, {"_id": 0})
+            artwork = artworks_by_id.get(item.artwork_id)
             if not artwork:
                 raise HTTPException(status_code=404, detail=f"Artwork {item.artwork_id} not found")
             
@@ -246,31 +501,33 @@ async def create_checkout_session(checkout_request: CheckoutRequest):
             total_amount += artwork['price'] * item.quantity
         
         # Create Stripe checkout session request
+        customer_email = checkout_request.customer_email or 'guest@example.com'
         session_request = CheckoutSessionRequest(
             line_items=line_items,
             mode='payment',
-            success_url='https://b53e54d0-03b2-4a93-9b74-3e843efe8655.preview.emergentagent.com/success?session_id={CHECKOUT_SESSION_ID}',
-            cancel_url='https://b53e54d0-03b2-4a93-9b74-3e843efe8655.preview.emergentagent.com',
+            success_url=CHECKOUT_SUCCESS_URL,
+            cancel_url=CHECKOUT_CANCEL_URL,
             metadata={
-                'customer_email': checkout_request.customer_email or 'guest@example.com',
-                'artwork_ids': ','.join([item.artwork_id for item in checkout_request.items])
+                'customer_email': customer_email,
+                'artwork_ids': ','.join(item.artwork_id for item in checkout_request.items)
             }
         )
         
         # Create checkout session
-        session_response = stripe_checkout.create_checkout_session(session_request)
+        session_response = await call_stripe(stripe_checkout.create_checkout_session, session_request)
         
-        # Store pending order in database
+        # Store pending order in database before handing the session to the client:
+        # it is the only record linking the Stripe session to the cart
         order_id = str(uuid.uuid4())
         order = {
             "id": order_id,
-            "items": [item.dict() for item in checkout_request.items],
+            "items": cart_items_adapter.dump_python(checkout_request.items),
             "total_amount": total_amount,
-            "customer_email": checkout_request.customer_email or 'guest@example.com',
+            "customer_email": customer_email,
             "status": "pending",
             "payment_session_id": session_response.session_id
         }
-        orders_collection.insert_one(order)
+        await insert_orders([order])
         
         return {
             "session_id": session_response.session_id,
@@ -278,16 +535,18 @@ async def create_checkout_session(checkout_request: CheckoutRequest):
             "order_id": order_id
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create checkout session: {str(e)}")
 
-@app.get("/api/checkout/session/{session_id}")
+@app.get("/api/checkout/session/{session_id}", dependencies=[Depends(limit_checkout_concurrency)])
 async def get_checkout_session(session_id: str):
     if not stripe_checkout:
         raise HTTPException(status_code=503, detail="Payment service not available")
     
     try:
-        status_response = stripe_checkout.get_checkout_session_status(session_id)
+        status_response = await call_stripe(stripe_checkout.get_checkout_session_status, session_id)
         return {
             "session_id": session_id,
             "status": status_response.status,
@@ -296,23 +555,50 @@ async def get_checkout_session(session_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get session status: {str(e)}")
 
-@app.post("/api/orders/{order_id}/complete")
-async def complete_order(order_id: str):
-    if not stripe_checkout:
-        raise HTTPException(status_code=503, detail="Payment service not available")
+@app.post("/api/stripe/webhook")
+async def stripe_webhook(request: Request):
+    if not STRIPE_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Stripe webhook not configured")
     
+    payload = await request.body()
+    signature = request.headers.get("stripe-signature")
+    try:
+        event = stripe.Webhook.construct_event(payload, signature, STRIPE_WEBHOOK_SECRET)
+    except (ValueError, stripe.error.SignatureVerificationError):
+        raise HTTPException(status_code=400, detail="Invalid webhook signature")
+    
+    if event["type"] in ("checkout.session.completed", "checkout.session.async_payment_succeeded"):
+        session = event["data"]["object"]
+        # Subscript access: newer stripe versions return StripeObjects that aren't dicts
+        if session["payment_status"] == "paid":
+            await orders_collection.update_one(
+                {"payment_session_id": session["id"]},
+                {"$set": {"status": "paid", "stripe_payment_status": "paid"}}
+            )
+    
+    return {"received": True}
+
+@app.post("/api/orders/{order_id}/complete", dependencies=[Depends(limit_checkout_concurrency)])
+async def complete_order(order_id: str):
     try:
         # Find the order
-        order = orders_collection.find_one({"id": order_id}, {"_id": 0})
+        order = await orders_collection.find_one({"id": order_id}, {"_id": 0})
         if not order:
             raise HTTPException(status_code=404, detail="Order not found")
         
-        # Verify payment with Stripe
-        if order.get("payment_session_id"):
-            status_response = stripe_checkout.get_checkout_session_status(order["payment_session_id"])
+        # Payment status is recorded by the Stripe webhook
+        if order.get("status") == "paid":
+            return {"message": "Order completed successfully", "order": order}
+        
+        # Without a webhook, verify payment with Stripe directly
+        if not STRIPE_WEBHOOK_SECRET and order.get("payment_session_id"):
+            if not stripe_checkout:
+                raise HTTPException(status_code=503, detail="Payment service not available")
+            
+            status_response = await call_stripe(stripe_checkout.get_checkout_session_status, order["payment_session_id"])
             if status_response.payment_status == "paid":
                 # Update order status
-                orders_collection.update_one(
+                await orders_collection.update_one(
                     {"id": order_id},
                     {"$set": {"status": "paid"}}
                 )
@@ -320,12 +606,73 @@ async def complete_order(order_id: str):
         
         raise HTTPException(status_code=400, detail="Payment not completed")
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to complete order: {str(e)}")
 
+@app.post("/api/orders/reconcile", dependencies=[Depends(limit_checkout_concurrency)])
+async def reconcile_pending_orders(x_admin_token: Optional[str] = Header(default=None)):
+    """Check the least recently checked pending orders against Stripe and update them in one batch"""
+    if not RECONCILE_TOKEN:
+        raise HTTPException(status_code=503, detail="Order reconciliation not configured")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, RECONCILE_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if not stripe_checkout:
+        raise HTTPException(status_code=503, detail="Payment service not available")
+    
+    # Never-checked orders sort first; orders whose lookup keeps failing are given up on
+    pending_orders = await orders_collection.find(
+        {
+            "status": "pending",
+            "payment_session_id": {"$ne": None},
+            "reconcile_failures": {"$not": {"$gte": RECONCILE_MAX_FAILURES}}
+        },
+        {"_id": 0, "id": 1, "payment_session_id": 1}
+    ).sort([("reconciled_at", 1), ("_id", 1)]).limit(RECONCILE_BATCH_SIZE).to_list(length=None)
+    
+    # call_stripe bounds how many of these run at once
+    statuses = await asyncio.gather(
+        *(call_stripe(stripe_checkout.get_checkout_session_status, order["payment_session_id"]) for order in pending_orders),
+        return_exceptions=True
+    )
+    
+    # Every checked order is stamped so the next batch moves on to other orders
+    reconciled_at = datetime.now(timezone.utc)
+    updates = []
+    paid = expired = failed = 0
+    for order, status_response in zip(pending_orders, statuses):
+        update = {"$set": {"reconciled_at": reconciled_at}}
+        if isinstance(status_response, Exception):
+            failed += 1
+            update["$inc"] = {"reconcile_failures": 1}
+        elif status_response.payment_status == "paid":
+            paid += 1
+            update["$set"]["status"] = "paid"
+        elif status_response.status == "expired":
+            # Abandoned checkouts leave the pending set so later batches don't recheck them
+            expired += 1
+            update["$set"]["status"] = "expired"
+        updates.append(UpdateOne({"id": order["id"]}, update))
+    
+    if updates:
+        await orders_collection.bulk_write(updates, ordered=False)
+    
+    return {"checked": len(pending_orders), "paid": paid, "expired": expired, "failed": failed}
+
 @app.get("/api/orders")
 async def get_orders():
-    orders = list(orders_collection.find({}, {"_id": 0}))
+    # Embed the ordered artworks so clients don't look each one up separately
+    pipeline = [
+        {"$lookup": {
+            "from": "artworks",
+            "localField": "items.artwork_id",
+            "foreignField": "id",
+            "as": "artwork_details"
+        }},
+        {"$project": {"_id": 0, "artwork_details._id": 0, "artwork_details.description": 0}}
+    ]
+    orders = await orders_collection.aggregate(pipeline).to_list(length=None)
     return orders
 
 if __name__ == "__main__":
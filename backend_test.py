@@ -1,72 +1,301 @@
 
-import requests
+import httpx
+import asyncio
 import sys
+import os
 import json
+import orjson
+import ijson
+import time
+import hashlib
+import argparse
+import functools
+from pathlib import Path
 from datetime import datetime
 
+# Opt-in on-disk cache of GET responses for quicker reruns while debugging
+CACHE_ENABLED = os.environ.get('BACKEND_TEST_CACHE') == '1'
+CACHE_DIR = Path('.cache/backend_test')
+CACHE_TTL_SECONDS = 300
+
+# Bound every request so one hung connection can't stall the suite
+REQUEST_TIMEOUT = httpx.Timeout(10.0, connect=3.0)
+REQUEST_ATTEMPTS = 3
+
+# Canned responses for --record / --mock runs
+FIXTURES_DIR = Path(__file__).parent / 'tests' / 'fixtures'
+
+def _fixture_path(method, endpoint):
+    digest = hashlib.blake2b(f"{method} {endpoint}".encode(), digest_size=8).hexdigest()
+    return FIXTURES_DIR / f"{method.lower()}_{endpoint.split('?')[0].split('/')[-1]}_{digest}.json"
+
+def record_fixture(method, endpoint, status, body):
+    FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+    fixture = {'method': method, 'endpoint': endpoint, 'status': status, 'body': body}
+    _fixture_path(method, endpoint).write_text(json.dumps(fixture, indent=2))
+
+def fixture_transport():
+    """httpx transport that answers every request from the recorded fixtures"""
+    fixtures = {}
+    for path in sorted(FIXTURES_DIR.glob('*.json')):
+        fixture = json.loads(path.read_text())
+        fixtures[(fixture['method'], f"/{fixture['endpoint']}")] = fixture
+    
+    def handler(request):
+        fixture = fixtures.get((request.method, request.url.raw_path.decode()))
+        if fixture is None:
+            return httpx.Response(404, json={'detail': 'No recorded fixture'})
+        return httpx.Response(
+            fixture['status'],
+            content=fixture['body'].encode(),
+            headers={'Content-Type': 'application/json'}
+        )
+    
+    return httpx.MockTransport(handler)
+
+def _cache_path(url):
+    return CACHE_DIR / f"{hashlib.blake2b(url.encode(), digest_size=16).hexdigest()}.json"
+
+def load_cached_response(url):
+    try:
+        entry = json.loads(_cache_path(url).read_text())
+    except (OSError, ValueError):
+        return None
+    if time.time() - entry['stored_at'] > CACHE_TTL_SECONDS:
+        return None
+    return entry['status'], entry['body']
+
+def store_cached_response(url, status, body):
+    # Errors are never cached, so a rerun sees when the backend recovers
+    if not 200 <= status < 300:
+        return
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    _cache_path(url).write_text(json.dumps({'stored_at': time.time(), 'status': status, 'body': body}))
+
+ARTWORK_ID_WAIT_SECONDS = 60
+
+def requires_artwork_id(test_func):
+    """Wait for a running test_get_all_artworks to find an artwork ID; fail the test if none is found"""
+    @functools.wraps(test_func)
+    async def wrapper(self, *args, **kwargs):
+        if self._artwork_id_ready is None:
+            # The listing test hasn't started, so don't wait on it
+            artwork_id = self.artwork_id
+        else:
+            try:
+                # shield() keeps a timeout here from cancelling the shared future
+                artwork_id = await asyncio.wait_for(asyncio.shield(self._artwork_id_ready), ARTWORK_ID_WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                artwork_id = None
+        if not artwork_id:
+            print("❌ No artwork ID available for testing")
+            return False
+        return await test_func(self, *args, **kwargs)
+    return wrapper
+
 class ArtistPortfolioTester:
-    def __init__(self, base_url):
+    def __init__(self, base_url, record=False, transport=None):
         self.base_url = base_url
+        self.record = record  # Save live responses as fixtures for --mock runs
         self.tests_run = 0
         self.tests_passed = 0
+        self.events = []  # One entry per request, printed as a table after the run
         self.artwork_id = None  # Will store an artwork ID for detailed tests
+        self._artwork_id_ready = None  # Resolved by test_get_all_artworks
+        self._url_cache = {}
+        self._cart_body = None  # Encoded once the artwork ID is known
+        self._checkout_body = None
+        
+        # HTTP/2 multiplexes the concurrent tests over a single TLS connection
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=True,
+            headers={'Content-Type': 'application/json'},
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+            transport=transport
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+    def _url(self, endpoint):
+        url = self._url_cache.get(endpoint)
+        if url is None:
+            url = self._url_cache[endpoint] = f"{self.base_url}/{endpoint}"
+        return url
 
-    def run_test(self, name, method, endpoint, expected_status, data=None):
-        """Run a single API test"""
-        url = f"{self.base_url}/{endpoint}"
-        headers = {'Content-Type': 'application/json'}
+    async def _request(self, method, endpoint, data=None):
+        """Return (status, body text), serving GETs from the disk cache when enabled
+
+        data may be a JSON-serialisable object or an already encoded bytes body.
+        """
+        use_cache = CACHE_ENABLED and method == 'GET'
+        if use_cache:
+            cached = load_cached_response(self._url(endpoint))
+            if cached is not None:
+                return cached
+        
+        for attempt in range(REQUEST_ATTEMPTS):
+            try:
+                response = await self.client.request(
+                    method,
+                    self._url(endpoint),
+                    content=data if data is None or isinstance(data, bytes) else orjson.dumps(data)
+                )
+                status, text = response.status_code, response.text
+                break
+            except httpx.TransportError as e:
+                # Non-GETs may already have been handled once a connection exists, so only
+                # retry them when the request never reached the server
+                retryable = method == 'GET' or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not retryable or attempt == REQUEST_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(0.2 * 2 ** attempt)
+        
+        if use_cache:
+            store_cached_response(self._url(endpoint), status, text)
+        if self.record:
+            record_fixture(method, endpoint, status, text)
+        return status, text
+
+    async def _stream_list(self, endpoint):
+        """GET a JSON array, returning (status, first item, item count) without building the list"""
+        url = self._url(endpoint)
+        keep_body = CACHE_ENABLED or self.record
+        cached = load_cached_response(url) if CACHE_ENABLED else None
+        
+        first, count = None, 0
+        items = ijson.sendable_list()
+        parser = ijson.items_coro(items, 'item')
+        
+        def feed(chunk):
+            nonlocal first, count
+            parser.send(chunk)
+            if items:
+                if first is None:
+                    first = items[0]
+                count += len(items)
+                del items[:]
         
+        if cached is not None:
+            status, text = cached
+            if status == 200:
+                feed(text.encode())
+        else:
+            body = []
+            async with self.client.stream('GET', url) as response:
+                status = response.status_code
+                async for chunk in response.aiter_bytes():
+                    if status == 200:
+                        feed(chunk)
+                    if keep_body:
+                        body.append(chunk)
+            
+            if keep_body:
+                text = b''.join(body).decode()
+                if CACHE_ENABLED:
+                    store_cached_response(url, status, text)
+                if self.record:
+                    record_fixture('GET', endpoint, status, text)
+        
+        if status == 200:
+            parser.close()
+        return status, first, count
+
+    async def run_list_test(self, name, endpoint, expected_status):
+        """Like run_test for a GET returning a JSON array, streaming the body
+
+        Returns (success, first item, item count).
+        """
         self.tests_run += 1
-        print(f"\n🔍 Testing {name}...")
+        started = time.perf_counter()
         
         try:
-            if method == 'GET':
-                response = requests.get(url, headers=headers)
-            elif method == 'POST':
-                response = requests.post(url, json=data, headers=headers)
-
-            success = response.status_code == expected_status
-            if success:
-                self.tests_passed += 1
-                print(f"✅ Passed - Status: {response.status_code}")
-                try:
-                    return success, response.json()
-                except:
-                    return success, {}
-            else:
-                print(f"❌ Failed - Expected {expected_status}, got {response.status_code}")
-                try:
-                    print(f"Response: {response.text}")
-                    return False, response.json()
-                except:
-                    return False, {}
+            status, first, count = await self._stream_list(endpoint)
+        except Exception as e:
+            self._record_event(name, None, False, started, f"Error: {str(e)}")
+            return False, None, 0
+        
+        success = status == expected_status
+        if success:
+            self.tests_passed += 1
+            self._record_event(name, status, True, started)
+        else:
+            self._record_event(name, status, False, started, f"Expected {expected_status}, got {status}")
+        return success, first, count
 
+    async def run_test(self, name, method, endpoint, expected_status, data=None):
+        """Run a single API test, recording the outcome in self.events"""
+        self.tests_run += 1
+        started = time.perf_counter()
+        
+        try:
+            status, text = await self._request(method, endpoint, data)
         except Exception as e:
-            print(f"❌ Failed - Error: {str(e)}")
+            self._record_event(name, None, False, started, f"Error: {str(e)}")
             return False, {}
+        
+        success = status == expected_status
+        if success:
+            self.tests_passed += 1
+            self._record_event(name, status, True, started)
+        else:
+            self._record_event(name, status, False, started, f"Expected {expected_status}, got {status}: {text}")
+        
+        try:
+            return success, orjson.loads(text)
+        except:
+            return success, {}
 
-    def test_get_all_artworks(self):
+    def _record_event(self, name, status, ok, started, detail=None):
+        self.events.append({
+            'name': name,
+            'status': status,
+            'ok': ok,
+            'ms': (time.perf_counter() - started) * 1000,
+            'detail': detail
+        })
+
+    def print_events(self):
+        """Print one summary table of every request made"""
+        width = max((len(event['name']) for event in self.events), default=0)
+        print(f"\n{'':2} {'Request':<{width}}  {'Status':>6}  {'Time':>9}")
+        for event in self.events:
+            status = event['status'] if event['status'] is not None else '-'
+            print(f"{'✅' if event['ok'] else '❌'} {event['name']:<{width}}  {status:>6}  {event['ms']:>7.1f}ms")
+            if event['detail']:
+                print(f"   {event['detail']}")
+
+    def _artwork_id_future(self):
+        if self._artwork_id_ready is None:
+            self._artwork_id_ready = asyncio.get_running_loop().create_future()
+        return self._artwork_id_ready
+
+    async def test_get_all_artworks(self):
         """Test getting all artworks"""
-        success, response = self.run_test(
-            "Get All Artworks",
-            "GET",
-            "api/artworks",
-            200
-        )
-        if success and isinstance(response, list) and len(response) > 0:
-            print(f"Found {len(response)} artworks")
-            # Store an artwork ID for later tests
-            self.artwork_id = response[0]['id']
-            return True
-        return False
+        self._artwork_id_future()  # Tests started from here on wait for the result
+        try:
+            # Only the first artwork and the count are needed, so stream instead of parsing the whole list
+            success, first, count = await self.run_list_test(
+                "Get All Artworks",
+                "api/artworks",
+                200
+            )
+            if success and count > 0:
+                print(f"Found {count} artworks")
+                # Store an artwork ID for later tests
+                self.artwork_id = first['id']
+                return True
+            return False
+        finally:
+            # Release the tests waiting on the artwork ID, even if none was found
+            self._artwork_id_future().set_result(self.artwork_id)
 
-    def test_get_artwork_by_id(self):
+    @requires_artwork_id
+    async def test_get_artwork_by_id(self):
         """Test getting a specific artwork by ID"""
-        if not self.artwork_id:
-            print("❌ No artwork ID available for testing")
-            return False
-            
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Get Artwork by ID",
             "GET",
             f"api/artworks/{self.artwork_id}",
@@ -77,18 +306,23 @@ class ArtistPortfolioTester:
             return True
         return False
 
-    def test_get_artworks_by_category(self):
+    async def test_get_artworks_by_category(self):
         """Test filtering artworks by category"""
         categories = ['abstract', 'landscape', 'digital']
         all_passed = True
         
-        for category in categories:
-            success, response = self.run_test(
+        # Request all categories concurrently
+        results = await asyncio.gather(*[
+            self.run_test(
                 f"Get Artworks by Category: {category}",
                 "GET",
                 f"api/artworks?category={category}",
                 200
             )
+            for category in categories
+        ])
+        
+        for category, (success, response) in zip(categories, results):
             if success and isinstance(response, list):
                 print(f"Found {len(response)} artworks in category '{category}'")
                 # Verify all returned artworks have the correct category
@@ -102,9 +336,9 @@ class ArtistPortfolioTester:
                 
         return all_passed
 
-    def test_get_featured_artworks(self):
+    async def test_get_featured_artworks(self):
         """Test getting featured artworks"""
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Get Featured Artworks",
             "GET",
             "api/featured-artworks",
@@ -115,48 +349,44 @@ class ArtistPortfolioTester:
             return True
         return False
 
-    def test_add_to_cart(self):
+    @requires_artwork_id
+    async def test_add_to_cart(self):
         """Test adding an artwork to cart"""
-        if not self.artwork_id:
-            print("❌ No artwork ID available for testing")
-            return False
-            
-        cart_data = {
-            "artwork_id": self.artwork_id,
-            "quantity": 1
-        }
+        if self._cart_body is None:
+            self._cart_body = orjson.dumps({
+                "artwork_id": self.artwork_id,
+                "quantity": 1
+            })
         
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Add to Cart",
             "POST",
             "api/cart/add",
             200,
-            data=cart_data
+            data=self._cart_body
         )
         return success
 
-    def test_checkout_session(self):
+    @requires_artwork_id
+    async def test_checkout_session(self):
         """Test creating a checkout session"""
-        if not self.artwork_id:
-            print("❌ No artwork ID available for testing")
-            return False
-            
-        checkout_data = {
-            "items": [
-                {
-                    "artwork_id": self.artwork_id,
-                    "quantity": 1
-                }
-            ],
-            "customer_email": "test@example.com"
-        }
-        
-        success, response = self.run_test(
+        if self._checkout_body is None:
+            self._checkout_body = orjson.dumps({
+                "items": [
+                    {
+                        "artwork_id": self.artwork_id,
+                        "quantity": 1
+                    }
+                ],
+                "customer_email": "test@example.com"
+            })
+        
+        success, response = await self.run_test(
             "Create Checkout Session",
             "POST",
             "api/checkout/create-session",
             200,
-            data=checkout_data
+            data=self._checkout_body
         )
         
         if success and 'session_id' in response and 'session_url' in response:
@@ -164,31 +394,54 @@ class ArtistPortfolioTester:
             return True
         return False
 
+async def run_named_test(test_name, test_func):
+    result = await test_func()
+    # One named line per test once it finishes, since concurrent tests complete in any order
+    print(f"📋 {'✅' if result else '❌'} {test_name}")
+    return result
+
+async def run_all(tester):
+    try:
+        # Tests needing an artwork ID wait for Get All Artworks through requires_artwork_id,
+        # whatever order the gather starts them in
+        tester._artwork_id_future()
+        await asyncio.gather(
+            run_named_test("Get All Artworks", tester.test_get_all_artworks),
+            run_named_test("Get Artwork by ID", tester.test_get_artwork_by_id),
+            run_named_test("Get Artworks by Category", tester.test_get_artworks_by_category),
+            run_named_test("Get Featured Artworks", tester.test_get_featured_artworks),
+            run_named_test("Add to Cart", tester.test_add_to_cart),
+            run_named_test("Create Checkout Session", tester.test_checkout_session)
+        )
+    finally:
+        await tester.close()
+
 def main():
+    parser = argparse.ArgumentParser(description="Test the Artist Portfolio API")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--record', action='store_true', help="save live responses to tests/fixtures")
+    mode.add_argument('--mock', action='store_true', help="replay tests/fixtures instead of calling the backend")
+    args = parser.parse_args()
+    
     # Get the backend URL from environment variable or use default
     backend_url = "https://b53e54d0-03b2-4a93-9b74-3e843efe8655.preview.emergentagent.com"
     
-    print(f"🚀 Testing Artist Portfolio API at {backend_url}")
+    print(f"🚀 Testing Artist Portfolio API at {backend_url}{' (mocked)' if args.mock else ''}")
     
     # Initialize tester
-    tester = ArtistPortfolioTester(backend_url)
-    
-    # Run tests
-    tests = [
-        ("Get All Artworks", tester.test_get_all_artworks),
-        ("Get Artwork by ID", tester.test_get_artwork_by_id),
-        ("Get Artworks by Category", tester.test_get_artworks_by_category),
-        ("Get Featured Artworks", tester.test_get_featured_artworks),
-        ("Add to Cart", tester.test_add_to_cart),
-        ("Create Checkout Session", tester.test_checkout_session)
-    ]
+    transport = fixture_transport() if args.mock else None
+    tester = ArtistPortfolioTester(backend_url, record=args.record, transport=transport)
     
-    for test_name, test_func in tests:
-        print(f"\n📋 Running test: {test_name}")
-        result = test_func()
-        print(f"Result: {'✅ Passed' if result else '❌ Failed'}")
+    # Run tests, on uvloop where it is available
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(run_all(tester))
+    else:
+        uvloop.run(run_all(tester))
     
     # Print summary
+    tester.print_events()
     print(f"\n📊 Tests passed: {tester.tests_passed}/{tester.tests_run}")
     return 0 if tester.tests_passed == tester.tests_run else 1
 
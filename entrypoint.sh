@@ -6,7 +6,8 @@ cd /backend || { echo "Backend directory not found"; exit 1; }
 
 echo "Starting FastAPI backend"
 # Start Uvicorn with proper host binding
-uvicorn server:app --host 0.0.0.0 --port 8001 &
+# Trust X-Forwarded-For from the local nginx so request.client is the real client address
+uvicorn server:app --host 0.0.0.0 --port 8001 --proxy-headers --forwarded-allow-ips=127.0.0.1 &
 BACKEND_PID=$!
 
 echo "Waiting for backend to start..."
@@ -0,0 +1,53 @@
+import os
+import json
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+from filelock import FileLock
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "live: calls a running backend (and Stripe); needs BACKEND_URL")
+
+def pytest_collection_modifyitems(config, items):
+    # Live tests are opt-in so offline and CI runs never hit a backend or create Stripe sessions
+    if os.environ.get("BACKEND_URL"):
+        return
+    skip_live = pytest.mark.skip(reason="set BACKEND_URL to run live backend tests")
+    for item in items:
+        if "live" in item.keywords:
+            item.add_marker(skip_live)
+
+@pytest.fixture(scope="session")
+def base_url():
+    return os.environ["BACKEND_URL"].rstrip("/")
+
+@pytest.fixture(scope="module")
+def session():
+    """Keep-alive session shared by the tests in a module"""
+    with requests.Session() as http:
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10)
+        http.mount("https://", adapter)
+        http.mount("http://", adapter)
+        yield http
+
+def fetch_artwork_id(base_url):
+    response = requests.get(f"{base_url}/api/artworks", timeout=10)
+    response.raise_for_status()
+    artworks = response.json()
+    assert artworks, "No artworks available for testing"
+    return artworks[0]["id"]
+
+@pytest.fixture(scope="session")
+def artwork_id(base_url, tmp_path_factory, worker_id):
+    if worker_id == "master":
+        # Not running under xdist
+        return fetch_artwork_id(base_url)
+    
+    # The first xdist worker fetches the id; the others read it from the shared temp dir
+    path = tmp_path_factory.getbasetemp().parent / "artwork_id.json"
+    with FileLock(f"{path}.lock"):
+        if path.exists():
+            return json.loads(path.read_text())
+        value = fetch_artwork_id(base_url)
+        path.write_text(json.dumps(value))
+        return value
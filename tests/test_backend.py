@@ -0,0 +1,53 @@
+"""Artist Portfolio API tests against a running backend.
+
+Skipped unless BACKEND_URL is set. Run in parallel with:
+    BACKEND_URL=https://... pytest -n auto tests/test_backend.py
+"""
+import pytest
+
+pytestmark = pytest.mark.live
+
+def test_get_all_artworks(session, base_url):
+    response = session.get(f"{base_url}/api/artworks", timeout=10)
+    assert response.status_code == 200
+    artworks = response.json()
+    assert isinstance(artworks, list)
+    assert len(artworks) > 0
+
+def test_get_artwork_by_id(session, base_url, artwork_id):
+    response = session.get(f"{base_url}/api/artworks/{artwork_id}", timeout=10)
+    assert response.status_code == 200
+    assert response.json()["id"] == artwork_id
+
+@pytest.mark.parametrize("category", ["abstract", "landscape", "digital"])
+def test_get_artworks_by_category(session, base_url, category):
+    response = session.get(f"{base_url}/api/artworks", params={"category": category}, timeout=10)
+    assert response.status_code == 200
+    assert all(artwork["category"] == category for artwork in response.json())
+
+def test_get_featured_artworks(session, base_url):
+    response = session.get(f"{base_url}/api/featured-artworks", timeout=10)
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
+
+def test_add_to_cart(session, base_url, artwork_id):
+    response = session.post(
+        f"{base_url}/api/cart/add",
+        json={"artwork_id": artwork_id, "quantity": 1},
+        timeout=10
+    )
+    assert response.status_code == 200
+
+def test_checkout_session(session, base_url, artwork_id):
+    response = session.post(
+        f"{base_url}/api/checkout/create-session",
+        json={
+            "items": [{"artwork_id": artwork_id, "quantity": 1}],
+            "customer_email": "test@example.com"
+        },
+        timeout=30
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert "session_id" in body
+    assert "session_url" in body
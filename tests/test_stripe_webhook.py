@@ -0,0 +1,80 @@
+"""Stripe webhook handler tests, run offline against the app with a fake orders collection."""
+import hashlib
+import hmac
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("motor")
+pytest.importorskip("stripe")
+pytest.importorskip("emergentintegrations")
+
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+import server
+
+WEBHOOK_SECRET = "whsec_test_secret"
+
+class FakeOrdersCollection:
+    def __init__(self):
+        self.updates = []
+
+    async def update_one(self, filter, update):
+        self.updates.append((filter, update))
+
+def sign(payload, secret=WEBHOOK_SECRET):
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+def checkout_event(payment_status):
+    return json.dumps({
+        "id": "evt_test",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "data": {
+            "object": {
+                "id": "cs_test_123",
+                "object": "checkout.session",
+                "payment_status": payment_status
+            }
+        }
+    })
+
+@pytest.fixture
+def orders(monkeypatch):
+    fake = FakeOrdersCollection()
+    monkeypatch.setattr(server, "orders_collection", fake)
+    monkeypatch.setattr(server, "STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    return fake
+
+@pytest.fixture
+def client():
+    # Not used as a context manager, so the startup hook (Mongo ping, seeding) doesn't run
+    return TestClient(server.app)
+
+def test_paid_checkout_marks_order_paid(client, orders):
+    payload = checkout_event("paid")
+    response = client.post("/api/stripe/webhook", content=payload, headers={"Stripe-Signature": sign(payload)})
+    assert response.status_code == 200
+    assert orders.updates == [(
+        {"payment_session_id": "cs_test_123"},
+        {"$set": {"status": "paid", "stripe_payment_status": "paid"}}
+    )]
+
+def test_unpaid_checkout_leaves_order_alone(client, orders):
+    payload = checkout_event("unpaid")
+    response = client.post("/api/stripe/webhook", content=payload, headers={"Stripe-Signature": sign(payload)})
+    assert response.status_code == 200
+    assert orders.updates == []
+
+def test_bad_signature_is_rejected(client, orders):
+    payload = checkout_event("paid")
+    response = client.post("/api/stripe/webhook", content=payload, headers={"Stripe-Signature": sign(payload, "whsec_wrong")})
+    assert response.status_code == 400
+    assert orders.updates == []